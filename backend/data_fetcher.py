@@ -5,11 +5,39 @@ Fetches and combines data from two SODA endpoints:
 2. Property assessment data (4bsw-nn7w.json)
 """
 
+import dataclasses
+import functools
+import gzip
+import hashlib
+import logging
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from math import atan2, cos, radians, sin, sqrt
+from typing import Optional
+
+import numpy as np
+import orjson
 import requests
-from sodapy import Socrata
-from shapely.geometry import shape, MultiPolygon, Polygon
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from shapely.geometry import shape
 import os
 
+try:
+    # Shapely 2.x: STRtree.query() accepts a predicate and returns indices
+    from shapely import STRtree
+except ImportError:
+    STRtree = None
+
+try:
+    # Optional: JIT-compiles the proximity fallback's match loop
+    from numba import njit
+except ImportError:
+    njit = None
+
+log = logging.getLogger(__name__)
+
 # Bounding box for the 4-block area (axis-aligned rectangle)
 # Adjusted from hand-picked coordinates to clean rectangle
 MIN_LAT = 51.03893877415592   # southernmost point
@@ -17,17 +45,154 @@ MAX_LAT = 51.03999458794443   # northernmost point
 MIN_LON = -114.07927447774654 # westernmost point
 MAX_LON = -114.07429304853973 # easternmost point
 
+EARTH_RADIUS_METERS = 6371000
+
+# Shared session so both SODA requests reuse pooled keep-alive connections
+# to data.calgary.ca instead of a fresh TCP+TLS handshake per call.
+# Connection errors and gateway errors are retried; read timeouts are not
+# (each would wait the full 120s again) and surface as Timeout, and an error
+# status that outlasts its retries is returned so raise_for_status() raises
+# the usual HTTPError
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=8,
+    max_retries=Retry(
+        total=3,
+        read=False,
+        backoff_factor=0.5,
+        status_forcelist=[502, 503, 504],
+        raise_on_status=False,
+    ),
+))
+_SESSION.headers["Accept-Encoding"] = "gzip, deflate"
+
+# On-disk cache for SODA payloads; Calgary Open Data updates at most daily
+CACHE_DIR = os.getenv("MASIV_CACHE_DIR", os.path.join(tempfile.gettempdir(), "masiv_cache"))
+CACHE_TTL_SECONDS = int(os.getenv("MASIV_CACHE_TTL", 86400))
+
+# Footprints sent to the frontend are simplified and rounded; 1e-6 degrees
+# (6 decimals) is roughly 0.1 m, well below what the 3D view can show
+FOOTPRINT_SIMPLIFY_TOLERANCE = 1e-6
+FOOTPRINT_DECIMALS = 6
+
+# (lat, lon) of each building from the last combine_building_data call,
+# row-aligned with its result, for downstream nearest-neighbour queries
+building_centroids = np.empty((0, 2), dtype=np.float64)
+
+
+@dataclasses.dataclass(slots=True)
+class Building:
+    """
+    A footprint combined with its matching property assessment.
+    Slotted to keep tens of thousands of records compact; orjson serializes
+    it directly, use to_dict() elsewhere.
+    """
+    id: str
+    struct_id: Optional[str]
+    address: str
+    latitude: float
+    longitude: float
+    height: float
+    land_use_designation: str
+    assessed_value: int
+    year_of_construction: Optional[str]
+    footprint: list
+
+    def to_dict(self):
+        """Shallow dict of the building's fields."""
+        return {f.name: getattr(self, f.name) for f in dataclasses.fields(self)}
+
 
 def _safe_int(value):
     """Safely convert a value to int, handling strings and None."""
     if value is None:
         return 0
+    try:
+        return _safe_int_cached(value)
+    except TypeError:
+        # Unhashable value, can't be a number anyway
+        return 0
+
+
+@functools.lru_cache(maxsize=4096)
+def _safe_int_cached(value):
+    """Memoized int(float(value)); SODA repeats the same value strings a lot."""
     try:
         return int(float(value))
     except (ValueError, TypeError):
         return 0
 
 
+def _safe_float(value, default=0.0):
+    """Safely convert a value to float, handling strings and None."""
+    if value is None:
+        return default
+    try:
+        return _safe_float_cached(value, default)
+    except TypeError:
+        # Unhashable value, can't be a number anyway
+        return default
+
+
+@functools.lru_cache(maxsize=4096)
+def _safe_float_cached(value, default):
+    """Memoized float(value); elevation strings repeat across footprints."""
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return default
+
+
+def _cached_get(url, params, ttl_seconds=CACHE_TTL_SECONDS):
+    """
+    GET a SODA endpoint and decode the JSON body, caching it on disk.
+    A cached payload younger than ttl_seconds skips the network entirely.
+    
+    Args:
+        url (str): Endpoint URL
+        params (dict): Query parameters
+        ttl_seconds (int): Maximum age of a cached payload
+    
+    Returns:
+        list: Decoded JSON payload
+    
+    Raises:
+        requests.exceptions.RequestException: If the request fails
+        ValueError: If the response is not valid JSON
+    """
+    key = hashlib.sha256(repr((url, sorted(params.items()))).encode()).hexdigest()
+    path = os.path.join(CACHE_DIR, f"{key}.json.gz")
+    
+    try:
+        if time.time() - os.path.getmtime(path) < ttl_seconds:
+            with gzip.open(path, "rb") as f:
+                data = orjson.loads(f.read())
+            log.debug(f"Cache hit: {path}")
+            return data
+    except (OSError, EOFError, ValueError):
+        pass  # Missing, stale or corrupt, fetch it again
+    
+    response = _SESSION.get(url, params=params, timeout=120)  # Increase timeout for slow networks
+    log.debug(f"Response status: {response.status_code}")
+    log.debug(f"Response size: {len(response.content)} bytes")
+    response.raise_for_status()
+    data = orjson.loads(response.content)
+    
+    # Only cache payloads that decoded, write to a temp file then rename so
+    # concurrent readers never see a partial file
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with gzip.open(tmp_path, "wb", compresslevel=6) as f:
+            f.write(response.content)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        log.warning(f"Could not write cache file {path}: {e}")
+    
+    return data
+
+
 def fetch_building_footprints():
     """
     Fetch building footprints and heights from Calgary Open Data.
@@ -41,28 +206,25 @@ def fetch_building_footprints():
     # Use SODA API with within_box filter for the bounding box
     # Note: within_box uses (lat, lon) ordering
     try:
-        print(f"Fetching from {url}...", flush=True)
-        response = requests.get(
+        log.info(f"Fetching from {url}...")
+        data = _cached_get(
             url,
             params={
                 "$limit": 50000,  # Fetch up to 50k records
+                # Only the columns combine_building_data uses
+                "$select": "struct_id,polygon,rooftop_elev_z,grd_elev_min_z",
                 "$where": f"""
                     within_box(polygon, {MIN_LAT}, {MIN_LON}, {MAX_LAT}, {MAX_LON})
                 """
             },
-            timeout=120  # Increase timeout for slow networks
         )
-        response.raise_for_status()
-        data = response.json()
-        print(f"✓ Footprints API returned {len(data) if data else 0} records", flush=True)
+        log.info(f"Footprints API returned {len(data) if data else 0} records")
         return data if data else []
     except requests.exceptions.Timeout:
-        print(f"ERROR: Footprints API request TIMED OUT after 120 seconds", flush=True)
+        log.error("Footprints API request TIMED OUT after 120 seconds")
         return []
     except Exception as e:
-        print(f"ERROR fetching building footprints: {e}", flush=True)
-        import traceback
-        traceback.print_exc()
+        log.exception(f"Error fetching building footprints: {e}")
         return []
 
 
@@ -81,47 +243,59 @@ def fetch_property_assessments():
         
         where_clause = f"within_box(multipolygon, {MIN_LAT}, {MIN_LON}, {MAX_LAT}, {MAX_LON})"
         
-        print(f"Fetching from {url}...", flush=True)
-        print(f"  Query: {where_clause}", flush=True)
+        log.info(f"Fetching from {url}...")
+        log.info(f"Query: {where_clause}")
         
-        response = requests.get(
+        results = _cached_get(
             url,
             params={
                 "$limit": 50000,
+                # Only the columns combine_building_data uses
+                "$select": "address,multipolygon,land_use_designation,assessed_value,year_of_construction",
                 "$where": where_clause
             },
-            timeout=120  # Increase timeout for slow networks
         )
-        
-        print(f"  Response status: {response.status_code}", flush=True)
-        print(f"  Response size: {len(response.text)} bytes", flush=True)
-        
-        response.raise_for_status()
-        results = response.json()
-        print(f"✓ Assessments API returned {len(results) if results else 0} records", flush=True)
+        log.info(f"Assessments API returned {len(results) if results else 0} records")
         
         if results and len(results) > 0:
-            print(f"  Sample record keys: {list(results[0].keys())}", flush=True)
+            log.debug(f"Sample record keys: {list(results[0].keys())}")
         
         return results if results else []
     except requests.exceptions.Timeout:
-        print(f"ERROR: Assessments API request TIMED OUT after 120 seconds", flush=True)
+        log.error("Assessments API request TIMED OUT after 120 seconds")
         return []
     except requests.exceptions.HTTPError as e:
-        print(f"ERROR: HTTP {response.status_code} from assessments API", flush=True)
-        print(f"  Response: {response.text[:500]}", flush=True)
+        log.error(f"HTTP {e.response.status_code} from assessments API")
+        log.error(f"Response: {e.response.text[:500]}")
         return []
     except ValueError as e:
-        print(f"ERROR: Failed to parse JSON from assessments API: {e}", flush=True)
-        print(f"  Response text: {response.text[:500]}", flush=True)
+        log.error(f"Failed to parse JSON from assessments API: {e}")
         return []
     except Exception as e:
-        print(f"ERROR fetching property assessments: {e}", flush=True)
-        import traceback
-        traceback.print_exc()
+        log.exception(f"Error fetching property assessments: {e}")
         return []
 
 
+def _coords_array(positions):
+    """
+    Convert a list of GeoJSON positions into an (N, 2) array of (lon, lat).
+    
+    Args:
+        positions (list): GeoJSON positions, e.g. [[lon, lat], [lon, lat], ...]
+    
+    Returns:
+        np.ndarray: (N, 2) float64 array, skipping positions without lon/lat
+    """
+    try:
+        arr = np.asarray(positions, dtype=np.float64)
+        if arr.ndim == 2 and arr.shape[1] >= 2:
+            return arr[:, :2]
+    except (ValueError, TypeError):
+        pass
+    # Ragged or mixed positions, keep only the ones that have lon/lat
+    return np.asarray([p[:2] for p in positions if len(p) >= 2], dtype=np.float64).reshape(-1, 2)
+
+
 def _get_polygon_centroid_simple(polygon_geojson):
     """
     Calculate centroid of a polygon by averaging all coordinates.
@@ -147,19 +321,15 @@ def _get_polygon_centroid_simple(polygon_geojson):
         if not ring or len(ring) < 3:
             return None
         
-        # Calculate average
-        lons = [c[0] for c in ring if len(c) >= 2]
-        lats = [c[1] for c in ring if len(c) >= 2]
-        
-        if not lons or not lats:
+        arr = _coords_array(ring)
+        if arr.size == 0:
             return None
         
-        centroid_lon = sum(lons) / len(lons)
-        centroid_lat = sum(lats) / len(lats)
+        centroid_lon, centroid_lat = arr.mean(axis=0)
         
-        return (centroid_lat, centroid_lon)
+        return (float(centroid_lat), float(centroid_lon))
     except Exception as e:
-        print(f"DEBUG: Error calculating simple centroid: {e}", flush=True)
+        log.debug(f"Error calculating simple centroid: {e}")
         return None
 
 
@@ -184,30 +354,51 @@ def _get_multipolygon_centroid_simple(multipolygon_geojson):
         
         # For MultiPolygon, coordinates is [[[[lon, lat], ...], ...], ...]
         # Flatten and average all points
-        all_lons = []
-        all_lats = []
-        
-        for polygon in coords:
-            if polygon:  # polygon is [[[lon, lat], ...], ...]
-                for ring in polygon:
-                    if ring:  # ring is [[lon, lat], ...]
-                        for point in ring:
-                            if len(point) >= 2:
-                                all_lons.append(point[0])
-                                all_lats.append(point[1])
+        rings = [_coords_array(ring) for polygon in coords if polygon for ring in polygon if ring]
+        if not rings:
+            return None
         
-        if not all_lons or not all_lats:
+        arr = np.concatenate(rings)
+        if arr.size == 0:
             return None
         
-        centroid_lon = sum(all_lons) / len(all_lons)
-        centroid_lat = sum(all_lats) / len(all_lats)
+        centroid_lon, centroid_lat = arr.mean(axis=0)
         
-        return (centroid_lat, centroid_lon)
+        return (float(centroid_lat), float(centroid_lon))
     except Exception as e:
-        print(f"DEBUG: Error calculating multipolygon centroid: {e}", flush=True)
+        log.debug(f"Error calculating multipolygon centroid: {e}")
         return None
 
 
+def _prep_centroid(centroid):
+    """
+    Precompute the per-point Haversine terms for a centroid, so they are
+    computed once per point rather than once per pair.
+    
+    Args:
+        centroid (tuple): (latitude, longitude) in degrees
+    
+    Returns:
+        tuple: (lat_radians, lon_radians, cos(lat_radians))
+    """
+    lat, lon = centroid
+    lat_r = radians(lat)
+    return (lat_r, radians(lon), cos(lat_r))
+
+
+def _haversine_prepped(p1, p2):
+    """
+    Haversine distance between two centroids prepared by _prep_centroid.
+    
+    Returns:
+        float: Distance in meters
+    """
+    lat1_r, lon1_r, cos_lat1 = p1
+    lat2_r, lon2_r, cos_lat2 = p2
+    a = sin((lat2_r - lat1_r)/2)**2 + cos_lat1 * cos_lat2 * sin((lon2_r - lon1_r)/2)**2
+    return 2 * EARTH_RADIUS_METERS * atan2(sqrt(a), sqrt(1-a))
+
+
 def buildings_match_by_proximity(footprint_polygon, assessment_multipolygon, threshold_meters=50):
     """
     Match buildings by proximity of their centroids instead of Shapely intersection.
@@ -229,68 +420,172 @@ def buildings_match_by_proximity(footprint_polygon, assessment_multipolygon, thr
             return False
         
         # Calculate distance using Haversine formula
-        from math import radians, sin, cos, sqrt, atan2
-        
-        lat1, lon1 = fp_centroid
-        lat2, lon2 = ap_centroid
-        
-        R = 6371000  # Earth radius in meters
-        
-        dlat = radians(lat2 - lat1)
-        dlon = radians(lon2 - lon1)
-        
-        a = sin(dlat/2)**2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon/2)**2
-        c = 2 * atan2(sqrt(a), sqrt(1-a))
-        distance = R * c
+        distance = _haversine_prepped(_prep_centroid(fp_centroid), _prep_centroid(ap_centroid))
         
         return distance <= threshold_meters
     except Exception as e:
-        print(f"ERROR in buildings_match_by_proximity: {type(e).__name__}: {e}", flush=True)
+        log.error(f"Error in buildings_match_by_proximity: {type(e).__name__}: {e}")
         return False
 
 
-def buildings_intersect(footprint_polygon, assessment_multipolygon):
+def _centroids_array(records, key):
+    """
+    Collect the simple (coordinate-average) centroids of a geometry field.
+    
+    Args:
+        records (list): Footprint or assessment records
+        key (str): Geometry field to read, "polygon" or "multipolygon"
+    
+    Returns:
+        np.ndarray: (N, 2) array of (latitude, longitude), NaN where unavailable
     """
-    Check if a building footprint polygon intersects with an assessment multipolygon.
+    centroid_fn = _get_multipolygon_centroid_simple if key == "multipolygon" else _get_polygon_centroid_simple
+    centroids = np.full((len(records), 2), np.nan, dtype=np.float64)
+    for i, record in enumerate(records):
+        centroid = centroid_fn(record.get(key))
+        if centroid:
+            centroids[i] = centroid
+    return centroids
+
+
+def _first_match_loop(lat1, lon1, cos_lat1, lat2, lon2, cos_lat2, threshold_meters):
+    """
+    Haversine first-match loop over prepared (radian) centroid arrays, compiled
+    with Numba when available. Unlike the full distance matrix, it stops at
+    the first assessment within threshold for each footprint.
+    
+    Returns:
+        np.ndarray: For each footprint, index of the first match, or -1
+    """
+    matches = np.full(lat1.shape[0], -1, dtype=np.intp)
+    for i in range(lat1.shape[0]):
+        for j in range(lat2.shape[0]):
+            a = np.sin((lat2[j] - lat1[i])/2)**2 + cos_lat1[i] * cos_lat2[j] * np.sin((lon2[j] - lon1[i])/2)**2
+            if 2 * EARTH_RADIUS_METERS * np.arctan2(np.sqrt(a), np.sqrt(1-a)) <= threshold_meters:
+                matches[i] = j
+                break
+    return matches
+
+
+# fastmath without "nnan"/"ninf", NaN centroids must still never match
+_first_match = None
+if njit is not None:
+    _first_match = njit(cache=True, fastmath={"nsz", "arcp", "contract", "afn", "reassoc"})(_first_match_loop)
+
+
+def _first_proximity_match(fp_centroids, ap_centroids, threshold_meters=50):
+    """
+    Vectorized version of buildings_match_by_proximity over every pair at once.
+    
+    Args:
+        fp_centroids (np.ndarray): (N, 2) footprint centroids as (lat, lon)
+        ap_centroids (np.ndarray): (M, 2) assessment centroids as (lat, lon)
+        threshold_meters (float): Maximum distance in meters for a match (default 50m)
+    
+    Returns:
+        np.ndarray: For each footprint, index of the first assessment within
+        threshold, or -1 if there is none
+    """
+    if len(fp_centroids) == 0 or len(ap_centroids) == 0:
+        return np.full(len(fp_centroids), -1, dtype=np.intp)
+    
+    # Per-point terms once per row/column, not once per pair
+    lat1, lon1 = np.radians(fp_centroids[:, 0]), np.radians(fp_centroids[:, 1])
+    lat2, lon2 = np.radians(ap_centroids[:, 0]), np.radians(ap_centroids[:, 1])
+    cos_lat1, cos_lat2 = np.cos(lat1), np.cos(lat2)
+    
+    if _first_match is not None:
+        return _first_match(lat1, lon1, cos_lat1, lat2, lon2, cos_lat2, float(threshold_meters))
+    
+    dlat = lat2[None, :] - lat1[:, None]
+    dlon = lon2[None, :] - lon1[:, None]
+    
+    a = np.sin(dlat/2)**2 + cos_lat1[:, None] * cos_lat2[None, :] * np.sin(dlon/2)**2
+    distance = 2 * EARTH_RADIUS_METERS * np.arctan2(np.sqrt(a), np.sqrt(1-a))
+    
+    # NaN centroids compare False, so they never match
+    within = distance <= threshold_meters
+    matches = np.argmax(within, axis=1)
+    matches[~within.any(axis=1)] = -1
+    return matches
+
+
+def buildings_intersect(fp_shape, ap_shape):
+    """
+    Check if a building footprint intersects with an assessment multipolygon.
     This is used to match buildings across the two datasets.
     
-    FALLBACK: Uses proximity-based matching due to Shapely issues on Render.
+    Geometries are parsed once up front (see _parse_shape); anything Shapely
+    can't parse goes through proximity matching instead.
     
     Args:
-        footprint_polygon (dict): GeoJSON Polygon object from footprint dataset
-        assessment_multipolygon (dict): GeoJSON MultiPolygon object from property dataset
+        fp_shape: Parsed Shapely Polygon from the footprint dataset
+        ap_shape: Parsed Shapely MultiPolygon from the property dataset
     
     Returns:
-        bool: True if geometries intersect (or are within proximity), False otherwise
+        bool: True if geometries intersect, False otherwise
     """
     try:
-        # Try Shapely first (works on local)
-        try:
-            fp_shape = shape(footprint_polygon)
-            ap_shape = shape(assessment_multipolygon)
-            result = fp_shape.intersects(ap_shape)
-            return result
-        except (TypeError, AttributeError, ValueError) as shapely_error:
-            # If Shapely fails, fall back to proximity matching
-            print(f"DEBUG: Shapely failed ({type(shapely_error).__name__}), falling back to proximity matching", flush=True)
-            return buildings_match_by_proximity(footprint_polygon, assessment_multipolygon)
+        return fp_shape.intersects(ap_shape)
     except Exception as e:
-        print(f"ERROR in buildings_intersect: {type(e).__name__}: {e}", flush=True)
+        log.error(f"Error in buildings_intersect: {type(e).__name__}: {e}")
         return False
 
 
-def get_polygon_centroid(polygon_geojson):
+def _first_intersecting(fp_shape, ap_shapes, ap_bboxes):
+    """
+    Find the first assessment shape that intersects a footprint, without an STRtree.
+    Used on Shapely versions whose STRtree can't query with a predicate.
+    
+    A vectorized bounding-box overlap test rejects most candidates before any
+    GEOS intersects() call is made.
+    
+    Args:
+        fp_shape: Parsed Shapely Polygon from the footprint dataset
+        ap_shapes (list): Parsed Shapely MultiPolygons from the property dataset
+        ap_bboxes (np.ndarray): (N, 4) array of ap_shapes bounds (minx, miny, maxx, maxy)
+    
+    Returns:
+        int: Position in ap_shapes of the first intersecting shape, or -1
+    """
+    minx, miny, maxx, maxy = fp_shape.bounds
+    overlaps = (
+        (ap_bboxes[:, 0] <= maxx) & (ap_bboxes[:, 2] >= minx) &
+        (ap_bboxes[:, 1] <= maxy) & (ap_bboxes[:, 3] >= miny)
+    )
+    for i in np.nonzero(overlaps)[0]:
+        if buildings_intersect(fp_shape, ap_shapes[i]):
+            return int(i)
+    return -1
+
+
+def _parse_shape(geojson):
+    """
+    Parse a GeoJSON geometry into a Shapely geometry.
+    
+    Args:
+        geojson (dict): GeoJSON geometry object
+    
+    Returns:
+        Shapely geometry, or None if Shapely cannot parse it
+    """
+    try:
+        return shape(geojson)
+    except Exception:
+        return None
+
+
+def get_polygon_centroid(poly):
     """
     Get the centroid (center) of a polygon in (lat, lon) format.
     
     Args:
-        polygon_geojson (dict): GeoJSON Polygon object
+        poly: Parsed Shapely Polygon
     
     Returns:
         tuple: (latitude, longitude) of the centroid
     """
     try:
-        poly = shape(polygon_geojson)
         centroid = poly.centroid
         # GeoJSON uses (lon, lat), convert to (lat, lon)
         return (centroid.y, centroid.x)
@@ -298,6 +593,32 @@ def get_polygon_centroid(polygon_geojson):
         return None
 
 
+def _simplify_footprint(fp_shape, polygon_geojson):
+    """
+    Get a simplified, rounded copy of a footprint's coordinates for display.
+    
+    Args:
+        fp_shape: Parsed Shapely Polygon, or None if Shapely couldn't parse it
+        polygon_geojson (dict): Original GeoJSON Polygon object
+    
+    Returns:
+        list: GeoJSON Polygon coordinates [[[lon, lat], ...], ...], exterior ring
+        first. Falls back to the original coordinates if simplification fails.
+    """
+    if fp_shape is not None:
+        try:
+            simplified = fp_shape.simplify(FOOTPRINT_SIMPLIFY_TOLERANCE, preserve_topology=False)
+            if simplified.geom_type == "Polygon" and not simplified.is_empty:
+                rings = [simplified.exterior, *simplified.interiors]
+                return [
+                    [[round(x, FOOTPRINT_DECIMALS), round(y, FOOTPRINT_DECIMALS)] for x, y, *_ in ring.coords]
+                    for ring in rings
+                ]
+        except Exception:
+            pass
+    return polygon_geojson.get("coordinates", [])
+
+
 def combine_building_data(footprints, assessments):
     """
     Combine footprint data with property assessment data by matching geometries.
@@ -308,72 +629,136 @@ def combine_building_data(footprints, assessments):
         assessments (list): Property assessment data
     
     Returns:
-        list: Combined building data with all attributes
+        list: Combined Building records with all attributes
     """
+    global building_centroids
+    
     combined = []
+    combined_rows = []
+    first_error_logged = False
+    
+    # Parse every assessment geometry once and index them in an STRtree, so each
+    # footprint only tests the handful of assessments whose bounding boxes overlap.
+    # Assessments Shapely can't parse are kept aside for proximity matching.
+    ap_shapes = []
+    ap_indices = []
+    geometry_indices = []
+    unparsed_indices = []
+    for i, assessment in enumerate(assessments):
+        multipolygon = assessment.get("multipolygon")
+        if not multipolygon:
+            continue
+        geometry_indices.append(i)
+        ap_shape = _parse_shape(multipolygon)
+        if ap_shape is None:
+            unparsed_indices.append(i)
+        else:
+            ap_shapes.append(ap_shape)
+            ap_indices.append(i)
+    tree = None
+    ap_bboxes = None
+    if ap_shapes:
+        if STRtree is not None:
+            tree = STRtree(ap_shapes)
+        else:
+            ap_bboxes = np.array([s.bounds for s in ap_shapes], dtype=np.float64)
+    
+    # Parse each footprint once; the shape and centroid are reused below
+    fp_shapes = [_parse_shape(f["polygon"]) if f.get("polygon") else None for f in footprints]
+    fp_centroids = np.array(
+        [(get_polygon_centroid(s) or (np.nan, np.nan)) if s is not None else (np.nan, np.nan) for s in fp_shapes],
+        dtype=np.float64,
+    ).reshape(-1, 2)
+    
+    # Index into assessments of each footprint's match, or -1
+    match_indices = np.full(len(footprints), -1, dtype=np.intp)
+    unparsed_footprints = []
+    unmatched_footprints = []
+    
+    for i, footprint in enumerate(footprints):
+        if not footprint.get("polygon"):
+            continue
+        
+        fp_shape = fp_shapes[i]
+        if fp_shape is None:
+            unparsed_footprints.append(i)
+            continue
+        
+        try:
+            first = -1
+            if tree is not None:
+                idxs = tree.query(fp_shape, predicate="intersects")
+                if len(idxs) > 0:
+                    # Lowest index keeps the original first-match-wins ordering
+                    first = int(idxs.min())
+            elif ap_bboxes is not None:
+                first = _first_intersecting(fp_shape, ap_shapes, ap_bboxes)
+            if first >= 0:
+                match_indices[i] = ap_indices[first]
+                continue
+        except Exception as e:
+            if not first_error_logged:
+                log.debug(f"First intersection error for {footprint.get('struct_id')}: {e}")
+                first_error_logged = True
+        unmatched_footprints.append(i)
+    
+    # Proximity fallback where Shapely couldn't parse one side of the pair:
+    # unparsed footprints against every assessment, and footprints without an
+    # intersection against the unparsed assessments. One vectorized pass each.
+    fallback_passes = [(unparsed_footprints, geometry_indices)]
+    if unparsed_indices:
+        fallback_passes.append((unmatched_footprints, unparsed_indices))
+    for fp_rows, ap_rows in fallback_passes:
+        if not fp_rows or not ap_rows:
+            continue
+        matches = _first_proximity_match(
+            _centroids_array([footprints[i] for i in fp_rows], "polygon"),
+            _centroids_array([assessments[i] for i in ap_rows], "multipolygon"),
+        )
+        for fp_row, match in zip(fp_rows, matches):
+            if match >= 0:
+                match_indices[fp_row] = ap_rows[match]
+    
     matched_count = 0
     failed_count = 0
-    first_error_logged = False
     
-    for footprint in footprints:
+    for i, footprint in enumerate(footprints):
         polygon = footprint.get("polygon")
-        struct_id = footprint.get("struct_id")
         if not polygon:
             continue
         
-        # Find matching assessment data
-        matching_assessment = None
-        match_found = False
-        
-        for assessment in assessments:
-            multipolygon = assessment.get("multipolygon")
-            if multipolygon:
-                try:
-                    if buildings_intersect(polygon, multipolygon):
-                        matching_assessment = assessment
-                        match_found = True
-                        matched_count += 1
-                        break
-                except Exception as e:
-                    if not first_error_logged:
-                        print(f"DEBUG: First intersection error for {struct_id}: {e}", flush=True)
-                        first_error_logged = True
-                    continue
-        
-        if not match_found:
+        matching_assessment = assessments[match_indices[i]] if match_indices[i] >= 0 else None
+        if matching_assessment is not None:
+            matched_count += 1
+        else:
             failed_count += 1
         
         # Calculate building height
-        height = None
-        try:
-            rooftop_z = float(footprint.get("rooftop_elev_z", 0))
-            ground_z = float(footprint.get("grd_elev_min_z", 0))
-            height = rooftop_z - ground_z
-        except (ValueError, TypeError):
-            height = 0
+        height = _safe_float(footprint.get("rooftop_elev_z")) - _safe_float(footprint.get("grd_elev_min_z"))
         
         # Get centroid for lat/lon
-        lat_lon = get_polygon_centroid(polygon)
-        if not lat_lon:
+        if np.isnan(fp_centroids[i, 0]):
             continue
+        combined_rows.append(i)
         
         # Build combined record
-        building = {
-            "id": str(footprint.get("struct_id", "")),
-            "struct_id": footprint.get("struct_id"),
-            "address": matching_assessment.get("address", "") if matching_assessment else "",
-            "latitude": lat_lon[0],
-            "longitude": lat_lon[1],
-            "height": height,
-            "land_use_designation": matching_assessment.get("land_use_designation", "") if matching_assessment else "",
-            "assessed_value": _safe_int(matching_assessment.get("assessed_value", 0) if matching_assessment else 0),
-            "year_of_construction": matching_assessment.get("year_of_construction") if matching_assessment else None,
-            "footprint": polygon.get("coordinates", []) if polygon else []
-        }
+        building = Building(
+            id=str(footprint.get("struct_id", "")),
+            struct_id=footprint.get("struct_id"),
+            address=matching_assessment.get("address", "") if matching_assessment else "",
+            latitude=float(fp_centroids[i, 0]),
+            longitude=float(fp_centroids[i, 1]),
+            height=height,
+            land_use_designation=matching_assessment.get("land_use_designation", "") if matching_assessment else "",
+            assessed_value=_safe_int(matching_assessment.get("assessed_value", 0) if matching_assessment else 0),
+            year_of_construction=matching_assessment.get("year_of_construction") if matching_assessment else None,
+            footprint=_simplify_footprint(fp_shapes[i], polygon),
+        )
         
         combined.append(building)
     
-    print(f"DEBUG: Matching results - matched: {matched_count}, failed: {failed_count}", flush=True)
+    log.debug(f"Matching results - matched: {matched_count}, failed: {failed_count}")
+    building_centroids = fp_centroids[combined_rows]
     return combined
 
 
@@ -384,27 +769,26 @@ def get_all_buildings():
     Returns:
         list: Combined building data for the target area
     """
-    print("=" * 60, flush=True)
-    print("STARTING: Fetching all building data", flush=True)
-    print("=" * 60, flush=True)
-    
-    print("Fetching building footprints...", flush=True)
-    footprints = fetch_building_footprints()
-    print(f"✓ Found {len(footprints)} building footprints", flush=True)
+    log.info("STARTING: Fetching all building data")
     
-    print("Fetching property assessments...", flush=True)
-    assessments = fetch_property_assessments()
-    print(f"✓ Found {len(assessments)} property assessments", flush=True)
+    # The two endpoints are independent, so fetch them concurrently
+    log.info("Fetching building footprints and property assessments...")
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        footprints_future = executor.submit(fetch_building_footprints)
+        assessments_future = executor.submit(fetch_property_assessments)
+        footprints = footprints_future.result()
+        assessments = assessments_future.result()
+    log.info(f"Found {len(footprints)} building footprints")
+    log.info(f"Found {len(assessments)} property assessments")
     
-    print("Combining data...", flush=True)
+    log.info("Combining data...")
     buildings = combine_building_data(footprints, assessments)
-    print(f"✓ Combined {len(buildings)} buildings with all attributes", flush=True)
+    log.info(f"Combined {len(buildings)} buildings with all attributes")
     
     # Count how many have matching assessment data
-    with_address = sum(1 for b in buildings if b["address"])
-    with_value = sum(1 for b in buildings if b["assessed_value"] > 0)
-    print(f"  - Buildings with address: {with_address}", flush=True)
-    print(f"  - Buildings with assessed value: {with_value}", flush=True)
+    with_address = sum(1 for b in buildings if b.address)
+    with_value = sum(1 for b in buildings if b.assessed_value > 0)
+    log.info(f"Buildings with address: {with_address}")
+    log.info(f"Buildings with assessed value: {with_value}")
     
-    print("=" * 60, flush=True)
     return buildings
@@ -0,0 +1,59 @@
+"""
+Filter kernels module.
+Numeric comparison kernels used by llm_processor.compile_filter, compiled
+with Numba when it is installed and falling back to NumPy ufuncs otherwise.
+Missing values are NaN and never match.
+"""
+
+import numpy as np
+
+try:
+    # Optional: compiles the comparison loops to machine code
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+def _filter_gt_loop(column, threshold):
+    out = np.empty(column.shape[0], dtype=np.bool_)
+    for i in range(column.shape[0]):
+        out[i] = column[i] > threshold
+    return out
+
+
+def _filter_lt_loop(column, threshold):
+    out = np.empty(column.shape[0], dtype=np.bool_)
+    for i in range(column.shape[0]):
+        out[i] = column[i] < threshold
+    return out
+
+
+def _filter_eq_loop(column, value):
+    out = np.empty(column.shape[0], dtype=np.bool_)
+    for i in range(column.shape[0]):
+        out[i] = column[i] == value
+    return out
+
+
+# Serial on purpose: workers are forked from a preloaded master (see
+# gunicorn.conf.py), and Numba's parallel threading layers aren't fork-safe
+if njit is not None:
+    filter_gt = njit(cache=True)(_filter_gt_loop)
+    filter_lt = njit(cache=True)(_filter_lt_loop)
+    filter_eq = njit(cache=True)(_filter_eq_loop)
+else:
+    filter_gt = np.greater
+    filter_lt = np.less
+    filter_eq = np.equal
+
+
+def warmup():
+    """Compile (or load from cache) the kernels so the first query doesn't pay for it."""
+    # Numba specializes on writability too: columns are writable until
+    # server.share_buildings_columns() makes them read-only shared views
+    column = np.zeros(1, dtype=np.float64)
+    shared_column = column.copy()
+    shared_column.flags.writeable = False
+    for kernel in (filter_gt, filter_lt, filter_eq):
+        kernel(column, 0.0)
+        kernel(shared_column, 0.0)
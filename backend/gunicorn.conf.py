@@ -0,0 +1,36 @@
+"""
+Gunicorn configuration for production.
+Run from backend/: gunicorn server:app
+"""
+
+import gc
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', 5000)}"
+workers = int(os.getenv("WEB_CONCURRENCY", 4))
+# Threaded workers: a request waiting on the LLM only blocks its own thread,
+# and concurrent queries reach the shared event loop together so the
+# micro-batcher in llm_processor can group them
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", 8))
+# Load the app, and with it the buildings cache, once in the master so
+# workers fork from a warm process instead of each fetching the data
+preload_app = True
+
+
+def when_ready(server):
+    """Finish warming the cache and share it before any worker is forked."""
+    import server as backend
+
+    # The warm-up thread doesn't survive fork; wait for it here
+    backend.get_buildings_cache()
+    backend.share_buildings_columns()
+    # Keep startup objects out of the GC's reach so collections in the
+    # workers don't write to (and un-share) their pages
+    gc.freeze()
+
+
+def on_exit(server):
+    import server as backend
+
+    backend.release_shared_columns()
@@ -4,44 +4,478 @@ Integrates with Hugging Face API to parse natural language queries
 into structured filter conditions.
 """
 
-import json
+import asyncio
+import atexit
+import hashlib
+import logging
 import os
-from openai import OpenAI
+import re
+import threading
+from collections import OrderedDict
+
+import httpx
+import numpy as np
+import orjson
+from openai import AsyncOpenAI
 from dotenv import load_dotenv
 
+import filter_kernels
+import query_cache
+
+try:
+    # Optional: lets httpx negotiate HTTP/2 with the inference router
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
 load_dotenv()
 
+log = logging.getLogger(__name__)
+
+LLM_BASE_URL = "https://router.huggingface.co/v1"
+LLM_TIMEOUT = httpx.Timeout(30.0, connect=5.0)
+LLM_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=32)
+
+
+def _create_client(key):
+    """Create an async OpenAI client with its own pooled, keep-alive HTTP client."""
+    return AsyncOpenAI(
+        base_url=LLM_BASE_URL,
+        api_key=key,
+        timeout=LLM_TIMEOUT,
+        http_client=httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            limits=LLM_LIMITS,
+            timeout=LLM_TIMEOUT,
+        ),
+    )
+
+
 # Initialize Hugging Face client with default key
 api_key = os.getenv("HF_TOKEN")
 
-client = None
-if api_key:
-    client = OpenAI(
-        base_url="https://router.huggingface.co/v1",
-        api_key=api_key,
-    )
+client = _create_client(api_key) if api_key else None
+
+# Clients for user-supplied keys, least recently used first, keyed by a hash
+# of the key; evicted clients have their connection pools closed
+CLIENT_CACHE_SIZE = 32
+_clients = OrderedDict()
+_clients_lock = threading.Lock()
+
+# Event loop on a background thread that runs every LLM call, so concurrent
+# requests share one loop and connection pool instead of each blocking on
+# its own synchronous client
+_loop = None
+_loop_lock = threading.Lock()
+
+# Micro-batching: LLM-bound queries arriving within one window are collected,
+# identical ones coalesced into a single call, and the rest issued together
+# under a concurrency cap. Created on the shared loop on first use.
+BATCH_WINDOW_MS = 25
+MAX_BATCH_SIZE = 32
+MAX_CONCURRENT_LLM_CALLS = 16
+_queue = None
+_llm_semaphore = None
+_batch_tasks = set()
 
 # Model to use for query interpretation
 MODEL = "moonshotai/Kimi-K2-Instruct-0905"
 
 # Valid attributes and operators for filtering
-VALID_ATTRIBUTES = ["height", "land_use_designation", "assessed_value", "address", "year_of_construction"]
-VALID_OPERATORS = [">", "<", "==", "contains"]
+VALID_ATTRIBUTES = frozenset({"height", "land_use_designation", "assessed_value", "address", "year_of_construction"})
+VALID_OPERATORS = frozenset({">", "<", "==", "contains"})
+NUMERIC_ATTRIBUTES = frozenset({"height", "assessed_value", "year_of_construction"})
+
+# Sent as a fixed system message so providers can cache the prefix across
+# requests; the per-request user message is a few examples plus the query
+SYSTEM_PROMPT = """Extract filter conditions from the user query.
+Return ONLY a valid JSON object (no extra text) with these fields:
+- attribute: one of [height, land_use_designation, assessed_value, address, year_of_construction]
+- operator: one of ['>', '<', '==', 'contains']
+- value: the filter value
+
+IMPORTANT CONVERSION RULES:
+- If user mentions feet/ft: convert to meters (1 foot = 0.3048 meters)
+- If user mentions dollars/$ or "million": convert to number (e.g., "$1 million" → 1000000)
+- For year/date filters: use year_of_construction attribute
+- For zoning/building type filters: use land_use_designation with 'contains' operator
+
+CALGARY LAND USE CODE MAPPINGS (use exact prefixes to avoid overlap):
+- "residential" or "house" → "R-" (matches R-CG, R-MH)
+- "multi-residential" or "apartment" or "condo" → "M-" (matches M-1, M-2, M-C1, M-C2, M-CG, M-G, M-H1, M-H2, M-H3, M-X1, M-X2)
+- "commercial" or "retail" or "shopping" → "C-C" or "C-N" or "C-O" or "C-R" or "C-COR" (NOT "CC-" which is downtown)
+- "industrial" or "factory" or "warehouse" → "I-" (matches I-B, I-C, I-E, I-G, I-H, I-O, I-R)
+- "office" or "business park" → "C-O" or "I-B"
+- "downtown" or "centre city" or "CC" → "CC-" (matches CC-COR, CC-MH, CC-MHX, CC-X, CC-E)
+- "mixed use" → "MU-"
+- "park" or "school" or "special purpose" → "S-\""""
+
+# Labeled examples; only the few closest to each query go into its user message
+FEW_SHOT_EXAMPLES = [
+    ("buildings over 100 feet", {"attribute": "height", "operator": ">", "value": 30.48}),
+    ("buildings taller than 50 meters", {"attribute": "height", "operator": ">", "value": 50}),
+    ("buildings shorter than 20 m", {"attribute": "height", "operator": "<", "value": 20}),
+    ("buildings under 40 ft tall", {"attribute": "height", "operator": "<", "value": 12.192}),
+    ("buildings built after 2010", {"attribute": "year_of_construction", "operator": ">", "value": 2010}),
+    ("buildings constructed before 1950", {"attribute": "year_of_construction", "operator": "<", "value": 1950}),
+    ("buildings built in 1985", {"attribute": "year_of_construction", "operator": "==", "value": 1985}),
+    ("buildings worth more than $1 million", {"attribute": "assessed_value", "operator": ">", "value": 1000000}),
+    ("properties valued under $500k", {"attribute": "assessed_value", "operator": "<", "value": 500000}),
+    ("buildings assessed at over 2.5 million dollars", {"attribute": "assessed_value", "operator": ">", "value": 2500000}),
+    ("commercial buildings", {"attribute": "land_use_designation", "operator": "contains", "value": "C-C"}),
+    ("residential buildings", {"attribute": "land_use_designation", "operator": "contains", "value": "R-"}),
+    ("apartment buildings", {"attribute": "land_use_designation", "operator": "contains", "value": "M-"}),
+    ("industrial buildings", {"attribute": "land_use_designation", "operator": "contains", "value": "I-"}),
+    ("downtown buildings", {"attribute": "land_use_designation", "operator": "contains", "value": "CC-"}),
+    ("office buildings", {"attribute": "land_use_designation", "operator": "contains", "value": "C-O"}),
+    ("mixed use buildings", {"attribute": "land_use_designation", "operator": "contains", "value": "MU-"}),
+    ("schools and parks", {"attribute": "land_use_designation", "operator": "contains", "value": "S-"}),
+    ("buildings zoned CC-X", {"attribute": "land_use_designation", "operator": "==", "value": "CC-X"}),
+    ("buildings on 17 Ave SW", {"attribute": "address", "operator": "contains", "value": "17 AV SW"}),
+]
+FEW_SHOT_COUNT = 3
+
+_FEW_SHOT_LINES = [
+    f'- "{example}" → {orjson.dumps(filter_dict).decode()}'
+    for example, filter_dict in FEW_SHOT_EXAMPLES
+]
+
+# Word-overlap fallback when no embedding model is installed. Words nearly
+# every query and example share carry no signal and are dropped before scoring
+_GENERIC_WORDS = frozenset({
+    "a", "all", "an", "are", "building", "buildings", "find", "in", "is", "me",
+    "of", "on", "properties", "property", "show", "than", "that", "the", "with",
+})
+# Cues for the attribute a query most likely targets
+_ATTRIBUTE_CUES = {
+    "height": re.compile(r"\b(?:tall|taller|short|shorter|height|high|higher|feet|foot|ft|meters?|m|storeys?|stor(?:y|ies)|floors?)\b"),
+    "assessed_value": re.compile(r"\$|\b(?:value|valued|worth|assessed|assessment|price|priced|cost|expensive|cheap|million|mil|thousand|\d+(?:\.\d+)?\s*(?:k|m|mil))\b"),
+    "year_of_construction": re.compile(r"\b(?:built|constructed|construction|year|old|older|oldest|new|newer|newest|since|(?:18|19|20)\d\d)\b"),
+    "land_use_designation": re.compile(r"\b(?:zon(?:e|ed|es|ing)|land use|residential|houses?|apartments?|condos?|"
+                                       r"commercial|retail|shops?|shopping|stores?|industrial|factor(?:y|ies)|"
+                                       r"warehouses?|offices?|downtown|mixed[- ]use|parks?|schools?)\b"),
+    "address": re.compile(r"\b(?:address|street|st|avenue|ave?|road|rd|drive|dr|boulevard|blvd|trail|tr)\b"),
+}
+
+
+def _tokenize(text):
+    return frozenset(re.findall(r"[a-z0-9$]+", text.lower())) - _GENERIC_WORDS
+
+
+_FEW_SHOT_TOKENS = [_tokenize(example) for example, _ in FEW_SHOT_EXAMPLES]
+_FEW_SHOT_ATTRIBUTES = [filter_dict["attribute"] for _, filter_dict in FEW_SHOT_EXAMPLES]
+_few_shot_embeddings = None  # (len(FEW_SHOT_EXAMPLES), dim), built on first use
+_few_shot_lock = threading.Lock()
+
+# The expected answer is a ~60 byte JSON object
+MAX_RESPONSE_TOKENS = 80
+
+# Column layout built by build_filter_columns
+NUMERIC_COLUMNS = ("height", "assessed_value", "year_of_construction")
+STRING_COLUMNS = ("land_use_designation", "address")
+# Low-cardinality string columns (a few dozen zoning codes across all
+# buildings) that are also indexed by distinct value
+INDEXED_COLUMNS = ("land_use_designation",)
+
+FEET_TO_METERS = 0.3048
+
+# Rule-based fast path for the templated queries the prompt already describes,
+# so they never need the LLM round trip
+_CMP = (r"(?<!\w)(?P<cmp>over|above|more than|greater than|higher than|taller than|exceeding|"
+        r"under|below|less than|lower than|shorter than|smaller than|>|<)")
+_NUM = r"(?P<num>\d[\d,]*(?:\.\d+)?)"
+_LESS_THAN = {"under", "below", "less than", "lower than", "shorter than", "smaller than", "<"}
+_VALUE_MULTIPLIERS = {"million": 1000000, "mil": 1000000, "m": 1000000, "thousand": 1000, "k": 1000}
+
+# Negations and ranges change the meaning in ways the patterns don't model
+_FAST_PATH_BLOCKERS = re.compile(r"\b(?:not|non|except|excluding|without|between|or)\b")
+
+# Checked in order; more specific codes first
+_LAND_USE_KEYWORDS = [
+    (re.compile(r"\bmulti[- ]?residential\b|\bapartments?\b|\bcondos?\b"), "M-"),
+    (re.compile(r"(?<!multi-)(?<!multi )(?<!multi)\bresidential\b|\bhouses?\b"), "R-"),
+    (re.compile(r"\bcommercial\b|\bretail\b|\bshopping\b"), "C-C"),
+    (re.compile(r"\bindustrial\b|\bfactor(?:y|ies)\b|\bwarehouses?\b"), "I-"),
+    (re.compile(r"\boffices?\b|\bbusiness parks?\b"), "C-O"),
+    (re.compile(r"\bdowntown\b|\bcentre city\b"), "CC-"),
+    (re.compile(r"\bmixed[- ]use\b"), "MU-"),
+    (re.compile(r"(?<!business )\bparks?\b|\bschools?\b|\bspecial purpose\b"), "S-"),
+]
+# Land-use keywords only count when nothing else in the query is specific;
+# "buildings on park ave" or "the warehouse district" are left to the LLM
+_LAND_USE_QUERY = re.compile(
+    r"(?:show |find |list )?(?:me )?(?:all |the )?(?P<keyword>.+?)"
+    r"(?: (?:buildings?|properties|property|zoning|zones?))?[.?!]?"
+)
+
+
+_HEIGHT_CUES = re.compile(r"\b(?:tall|taller|short|shorter|height|high|higher)\b")
+
+
+def _comparison_operator(match):
+    return "<" if match.group("cmp") in _LESS_THAN else ">"
+
+
+def _height_filter(match):
+    unit = match.group("unit")
+    # A bare "m" is just as often millions ("over 3m"); leave those to the LLM
+    if unit == "m" and not _HEIGHT_CUES.search(match.string):
+        return None
+    value = float(match.group("num").replace(",", ""))
+    if unit in ("feet", "foot", "ft"):
+        value = round(value * FEET_TO_METERS, 4)
+    return {"attribute": "height", "operator": _comparison_operator(match), "value": value}
+
+
+def _year_filter(match):
+    cmp = match.group("cmp")
+    year = float(match.group("num"))
+    if cmp in ("before", "prior to"):
+        return {"attribute": "year_of_construction", "operator": "<", "value": year}
+    # "since" includes the year itself
+    return {"attribute": "year_of_construction", "operator": ">", "value": year - 1 if cmp == "since" else year}
+
+
+def _value_filter(match):
+    value = float(match.group("num").replace(",", ""))
+    value *= _VALUE_MULTIPLIERS.get(match.group("mult") or "", 1)
+    return {"attribute": "assessed_value", "operator": _comparison_operator(match), "value": value}
+
+
+_FAST_PATTERNS = [
+    (re.compile(rf"{_CMP}\s*{_NUM}\s*(?P<unit>feet|foot|ft|meters?|metres?|m)\b"), _height_filter),
+    (re.compile(r"\b(?P<cmp>after|since|before|prior to)\s*(?P<num>\d{4})\b"), _year_filter),
+    (re.compile(rf"\b(?:worth|valued?(?: at)?|assessed(?: at)?)\s+{_CMP}\s*\$?\s*{_NUM}\s*"
+                r"(?P<mult>million|mil|thousand|k|m)?\b"), _value_filter),
+    (re.compile(rf"{_CMP}\s*\$\s*{_NUM}\s*(?P<mult>million|mil|thousand|k|m)?\b"), _value_filter),
+]
+
+
+def _get_few_shot_embeddings():
+    """Embed the few-shot examples once, or None if no embedding model is available."""
+    global _few_shot_embeddings
+    with _few_shot_lock:
+        if _few_shot_embeddings is None:
+            vectors = [query_cache.embed_query(example) for example, _ in FEW_SHOT_EXAMPLES]
+            if any(v is None for v in vectors):
+                return None
+            _few_shot_embeddings = np.stack(vectors)
+        return _few_shot_embeddings
+
+
+def select_examples(user_query, count=FEW_SHOT_COUNT):
+    """
+    Pick the few-shot examples most similar to a query.
+    Ranks by embedding cosine similarity when the semantic cache's model is
+    available, otherwise by word overlap (see _lexical_examples).
+    
+    Args:
+        user_query (str): Natural language query from the user
+        count (int): Number of examples to return
+    
+    Returns:
+        str: Selected examples, one "- query → filter" line each
+    """
+    embeddings = _get_few_shot_embeddings()
+    query_vector = query_cache.embed_query(user_query) if embeddings is not None else None
+    if query_vector is not None and query_vector.shape[0] == embeddings.shape[1]:
+        # Stable sort keeps list order among ties
+        best = np.argsort(-(embeddings @ query_vector), kind="stable")[:count].tolist()
+    else:
+        best = _lexical_examples(user_query, count)
+    return "\n".join(_FEW_SHOT_LINES[i] for i in best)
+
+
+def _lexical_examples(user_query, count):
+    """
+    Rank few-shot examples by Jaccard overlap of their non-generic words with
+    the query, making sure the attribute the query most likely targets is
+    represented. With no clear target attribute, returns the best example
+    for each attribute instead.
+    
+    Returns:
+        list: Indices into FEW_SHOT_EXAMPLES
+    """
+    words = _tokenize(user_query)
+    scores = np.array([len(words & tokens) / (len(words | tokens) or 1) for tokens in _FEW_SHOT_TOKENS])
+    ranked = np.argsort(-scores, kind="stable").tolist()
+    
+    query = user_query.lower()
+    cue_counts = {attribute: len(cue.findall(query)) for attribute, cue in _ATTRIBUTE_CUES.items()}
+    top = max(cue_counts.values())
+    winners = [attribute for attribute, hits in cue_counts.items() if hits == top]
+    if top == 0 or len(winners) > 1:
+        # One example per attribute, the closest of each, in ranked order
+        seen = set()
+        spread = []
+        for i in ranked:
+            if _FEW_SHOT_ATTRIBUTES[i] not in seen:
+                seen.add(_FEW_SHOT_ATTRIBUTES[i])
+                spread.append(i)
+        return spread
+    
+    best = ranked[:count]
+    target = winners[0]
+    if all(_FEW_SHOT_ATTRIBUTES[i] != target for i in best):
+        best[-1] = next(i for i in ranked if _FEW_SHOT_ATTRIBUTES[i] == target)
+    return best
 
 
 def get_client(api_key=None):
-    """Get or create OpenAI client with optional override API key."""
-    if api_key:
-        return OpenAI(
-            base_url="https://router.huggingface.co/v1",
-            api_key=api_key,
-        )
-    return client
+    """
+    Get async OpenAI client with optional override API key.
+
+    Clients are cached per key so repeat requests reuse open connections
+    instead of paying a new TLS handshake.
+    """
+    if not api_key:
+        return client
+    
+    key = hashlib.sha256(api_key.encode()).hexdigest()
+    evicted = None
+    with _clients_lock:
+        llm_client = _clients.get(key)
+        if llm_client is not None:
+            _clients.move_to_end(key)
+            return llm_client
+        llm_client = _clients[key] = _create_client(api_key)
+        if len(_clients) > CLIENT_CACHE_SIZE:
+            _, evicted = _clients.popitem(last=False)
+    if evicted is not None:
+        asyncio.run_coroutine_threadsafe(_close_client(evicted), _get_loop())
+    return llm_client
+
+
+async def _close_client(llm_client):
+    """Close an evicted client once any call still using it has timed out."""
+    await asyncio.sleep(LLM_TIMEOUT.read)
+    await llm_client.close()
+
+
+def _get_loop():
+    """Get the shared LLM event loop, starting its thread on first use."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="llm-event-loop", daemon=True).start()
+            _loop = loop
+    return _loop
+
+
+def _stop_loop():
+    """Cancel the scheduler and any in-flight batches so exit is quiet."""
+    if _loop is None or not _loop.is_running():
+        return
+    
+    async def cancel_tasks():
+        tasks = [task for task in _batch_tasks if not task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    
+    try:
+        asyncio.run_coroutine_threadsafe(cancel_tasks(), _loop).result(timeout=1)
+    except Exception:
+        pass
+    _loop.call_soon_threadsafe(_loop.stop)
+
+
+atexit.register(_stop_loop)
+
+
+def _fast_parse(user_query):
+    """
+    Parse simple templated queries locally without calling the LLM.
+    
+    Args:
+        user_query (str): Natural language query from the user
+    
+    Returns:
+        dict: Filter with keys: attribute, operator, value
+        Returns None unless exactly one unambiguous filter was recognized
+    """
+    query = " ".join(user_query.lower().split())
+    if _FAST_PATH_BLOCKERS.search(query):
+        return None
+    
+    candidates = []
+    for pattern, build_filter in _FAST_PATTERNS:
+        for match in pattern.finditer(query):
+            filter_dict = build_filter(match)
+            # Builders decline matches they can't read unambiguously
+            if filter_dict is not None:
+                candidates.append(filter_dict)
+    if any(pattern.search(query) for pattern, _ in _LAND_USE_KEYWORDS):
+        match = _LAND_USE_QUERY.fullmatch(query)
+        codes = [code for pattern, code in _LAND_USE_KEYWORDS if match and pattern.fullmatch(match["keyword"])]
+        if len(codes) != 1:
+            return None
+        candidates.append({"attribute": "land_use_designation", "operator": "contains", "value": codes[0]})
+    
+    # Several patterns can recognize the same filter; anything else is compound
+    unique = {tuple(sorted(c.items())) for c in candidates}
+    if len(unique) != 1:
+        return None
+    return candidates[0]
+
+
+async def _stream_completion(llm_client, messages):
+    """
+    Stream a chat completion, stopping as soon as the output is a complete
+    JSON object instead of waiting for the model to finish.
+    
+    Args:
+        llm_client (AsyncOpenAI): Client to call
+        messages (list): Chat messages
+    
+    Returns:
+        str: Response text
+    """
+    stream = await llm_client.chat.completions.create(
+        model=MODEL,
+        messages=messages,
+        max_tokens=MAX_RESPONSE_TOKENS,
+        temperature=0,
+        stream=True,
+    )
+    response_text = ""
+    try:
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            response_text += chunk.choices[0].delta.content or ""
+            if response_text.rstrip().endswith("}"):
+                try:
+                    orjson.loads(response_text)
+                    break
+                except orjson.JSONDecodeError:
+                    pass
+    finally:
+        await stream.close()
+    return response_text
 
 
 def parse_query(user_query, api_key=None):
     """
     Use LLM to parse a natural language query into a structured filter.
+    Blocking wrapper that runs parse_query_async on the shared LLM event loop.
+    
+    Args:
+        user_query (str): Natural language query from the user
+        api_key (str): Optional Hugging Face API key override
+    
+    Returns:
+        dict: Parsed filter with keys: attribute, operator, value
+        Returns None if parsing fails or query is invalid
+    """
+    return asyncio.run_coroutine_threadsafe(parse_query_async(user_query, api_key), _get_loop()).result()
+
+
+async def parse_query_async(user_query, api_key=None):
+    """
+    Use LLM to parse a natural language query into a structured filter.
     
     Args:
         user_query (str): Natural language query from the user
@@ -52,62 +486,103 @@ def parse_query(user_query, api_key=None):
         Returns None if parsing fails or query is invalid
     """
     
+    # Templated queries are parsed locally
+    filter_dict = _fast_parse(user_query)
+    if filter_dict and validate_filter(filter_dict):
+        log.debug(f"Fast path parsed: {filter_dict}")
+        return normalize_filter_values(filter_dict)
+    
+    # Repeated and near-duplicate queries skip the LLM round trip
+    cached = await asyncio.to_thread(query_cache.lookup, user_query)
+    if cached is not None:
+        log.debug(f"Query cache hit: {cached}")
+        return cached
+    
     llm_client = get_client(api_key)
     if not llm_client:
         raise ValueError("No Hugging Face API key available. Provide HF_TOKEN in .env or pass api_key parameter.")
     
-    prompt = f"""Extract filter conditions from this user query: '{user_query}'
-Return ONLY a valid JSON object (no extra text) with these fields:
-- attribute: one of [height, land_use_designation, assessed_value, address, year_of_construction]
-- operator: one of ['>', '<', '==', 'contains']
-- value: the filter value
+    # Wait for the batch scheduler to run this query
+    global _queue, _llm_semaphore
+    if _queue is None:
+        _queue = asyncio.Queue()
+        _llm_semaphore = asyncio.Semaphore(MAX_CONCURRENT_LLM_CALLS)
+        _spawn(_scheduler())
+    future = asyncio.get_running_loop().create_future()
+    await _queue.put((user_query, api_key, llm_client, future))
+    filter_dict = await future
+    return dict(filter_dict) if filter_dict else filter_dict
 
-IMPORTANT CONVERSION RULES:
-- If user mentions feet/ft: convert to meters (1 foot = 0.3048 meters)
-- If user mentions dollars/$ or "million": convert to number (e.g., "$1 million" → 1000000)
-- For year/date filters: use year_of_construction attribute
-- For zoning/building type filters: use land_use_designation with 'contains' operator
 
-CALGARY LAND USE CODE MAPPINGS (use exact prefixes to avoid overlap):
-- "residential" or "house" → "R-" (matches R-CG, R-MH)
-- "multi-residential" or "apartment" or "condo" → "M-" (matches M-1, M-2, M-C1, M-C2, M-CG, M-G, M-H1, M-H2, M-H3, M-X1, M-X2)
-- "commercial" or "retail" or "shopping" → "C-C" or "C-N" or "C-O" or "C-R" or "C-COR" (NOT "CC-" which is downtown)
-- "industrial" or "factory" or "warehouse" → "I-" (matches I-B, I-C, I-E, I-G, I-H, I-O, I-R)
-- "office" or "business park" → "C-O" or "I-B"
-- "downtown" or "centre city" or "CC" → "CC-" (matches CC-COR, CC-MH, CC-MHX, CC-X, CC-E)
-- "mixed use" → "MU-"
-- "park" or "school" or "special purpose" → "S-"
-
-Examples:
-- "buildings over 100 feet" → {{"attribute": "height", "operator": ">", "value": 30.48}}
-- "buildings built after 2010" → {{"attribute": "year_of_construction", "operator": ">", "value": 2010}}
-- "buildings worth more than $1 million" → {{"attribute": "assessed_value", "operator": ">", "value": 1000000}}
-- "commercial buildings" → {{"attribute": "land_use_designation", "operator": "contains", "value": "C-C"}}
-- "residential buildings" → {{"attribute": "land_use_designation", "operator": "contains", "value": "R-"}}
-- "apartment buildings" → {{"attribute": "land_use_designation", "operator": "contains", "value": "M-"}}
-- "industrial buildings" → {{"attribute": "land_use_designation", "operator": "contains", "value": "I-"}}
-- "downtown buildings" → {{"attribute": "land_use_designation", "operator": "contains", "value": "CC-"}}
-- "office buildings" → {{"attribute": "land_use_designation", "operator": "contains", "value": "C-O"}}
-
-User query: {user_query}
-Response JSON:"""
+def _spawn(coro):
+    """Start a task on the running loop, holding a reference until it finishes."""
+    task = asyncio.create_task(coro)
+    _batch_tasks.add(task)
+    task.add_done_callback(_batch_tasks.discard)
+    return task
+
+
+async def _scheduler():
+    """Collect queued queries into batches, one per BATCH_WINDOW_MS window."""
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await _queue.get()]
+        deadline = loop.time() + BATCH_WINDOW_MS / 1000
+        while len(batch) < MAX_BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(_queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        _spawn(_run_batch(batch))
+
+
+async def _run_batch(batch):
+    """Issue one LLM call per distinct query in a batch and resolve every waiter."""
+    groups = {}
+    for user_query, api_key, llm_client, future in batch:
+        key = (query_cache.normalize_query(user_query), api_key)
+        groups.setdefault(key, (user_query, llm_client, []))[2].append(future)
+    
+    async def run_group(user_query, llm_client, futures):
+        async with _llm_semaphore:
+            try:
+                result = await _parse_with_llm(llm_client, user_query)
+            except Exception as e:
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+        for future in futures:
+            if not future.done():
+                future.set_result(result)
+    
+    await asyncio.gather(*(run_group(*group) for group in groups.values()))
+
+
+async def _parse_with_llm(llm_client, user_query):
+    """
+    Parse a query with the LLM, then validate, normalize, and cache the result.
     
+    Args:
+        llm_client (AsyncOpenAI): Client to call
+        user_query (str): Natural language query from the user
+    
+    Returns:
+        dict: Parsed filter, or None if the LLM call or its output failed
+    """
     try:
-        completion = llm_client.chat.completions.create(
-            model=MODEL,
-            messages=[
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-        )
-        
-        response_text = completion.choices[0].message.content
-        print(f"LLM Response: {response_text}")
+        examples = await asyncio.to_thread(select_examples, user_query)
+        response_text = await _stream_completion(llm_client, [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": f"Examples:\n{examples}\n\nUser query: {user_query}\nResponse JSON:"},
+        ])
+        log.debug(f"LLM Response: {response_text}")
         
         # Parse the JSON response
-        filter_dict = json.loads(response_text)
+        filter_dict = orjson.loads(response_text)
         
         # Validate the parsed filter
         if not validate_filter(filter_dict):
@@ -116,13 +591,16 @@ Response JSON:"""
         # Convert value types as needed
         filter_dict = normalize_filter_values(filter_dict)
         
+        if filter_dict:
+            await asyncio.to_thread(query_cache.store, user_query, filter_dict)
+        
         return filter_dict
         
-    except json.JSONDecodeError as e:
-        print(f"Failed to parse LLM response as JSON: {e}")
+    except orjson.JSONDecodeError as e:
+        log.warning(f"Failed to parse LLM response as JSON: {e}")
         return None
     except Exception as e:
-        print(f"Error calling LLM API: {e}")
+        log.error(f"Error calling LLM API: {e}")
         return None
 
 
@@ -137,30 +615,30 @@ def validate_filter(filter_dict):
         bool: True if valid, False otherwise
     """
     if not isinstance(filter_dict, dict):
-        print("Filter must be a dictionary")
+        log.warning("Filter must be a dictionary")
         return False
     
     # Check required fields
     if "attribute" not in filter_dict:
-        print("Filter missing 'attribute' field")
+        log.warning("Filter missing 'attribute' field")
         return False
     
     if "operator" not in filter_dict:
-        print("Filter missing 'operator' field")
+        log.warning("Filter missing 'operator' field")
         return False
     
     if "value" not in filter_dict:
-        print("Filter missing 'value' field")
+        log.warning("Filter missing 'value' field")
         return False
     
     # Validate attribute
     if filter_dict["attribute"] not in VALID_ATTRIBUTES:
-        print(f"Invalid attribute: {filter_dict['attribute']}")
+        log.warning(f"Invalid attribute: {filter_dict['attribute']}")
         return False
     
     # Validate operator
     if filter_dict["operator"] not in VALID_OPERATORS:
-        print(f"Invalid operator: {filter_dict['operator']}")
+        log.warning(f"Invalid operator: {filter_dict['operator']}")
         return False
     
     return True
@@ -176,24 +654,119 @@ def normalize_filter_values(filter_dict):
     Returns:
         dict: Filter with normalized values
     """
-    numeric_attributes = ["height", "assessed_value", "year_of_construction"]
-    
-    if filter_dict["attribute"] in numeric_attributes:
+    if filter_dict["attribute"] in NUMERIC_ATTRIBUTES:
         try:
             filter_dict["value"] = float(filter_dict["value"])
         except (ValueError, TypeError):
-            print(f"Could not convert value to number: {filter_dict['value']}")
+            log.warning(f"Could not convert value to number: {filter_dict['value']}")
             return None
     
     return filter_dict
 
 
-def apply_filter(buildings, filter_dict):
+def _as_float(value):
+    """Convert a building value to float, NaN when missing or not numeric."""
+    if value is None:
+        return np.nan
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return np.nan
+
+
+def build_filter_columns(buildings):
+    """
+    Convert building records into columnar NumPy arrays for apply_filter.
+    Built once per buildings cache; every filter then runs as a single
+    vectorized comparison instead of a per-building Python loop.
+    
+    Args:
+        buildings (list): List of Building records
+    
+    Returns:
+        dict: Attribute name -> np.ndarray, plus "id". Numeric columns are
+        float64 with NaN for missing values, string columns are str arrays
+        with "" for missing values and a lowercase copy under "<name>_lower".
+        Indexed columns also get their distinct lowercase values under
+        "<name>_codes" and each building's position in it under "<name>_inverse".
+    """
+    columns = {"id": np.array([b.id for b in buildings], dtype=str)}
+    for attribute in NUMERIC_COLUMNS:
+        columns[attribute] = np.array([_as_float(getattr(b, attribute)) for b in buildings], dtype=np.float64)
+    for attribute in STRING_COLUMNS:
+        values = [getattr(b, attribute) for b in buildings]
+        columns[attribute] = np.array([v if isinstance(v, str) else "" for v in values], dtype=str)
+        # Lowercase mirror so filters never re-lowercase the buildings' side
+        columns[f"{attribute}_lower"] = np.char.lower(columns[attribute])
+    for attribute in INDEXED_COLUMNS:
+        codes, inverse = np.unique(columns[f"{attribute}_lower"], return_inverse=True)
+        columns[f"{attribute}_codes"] = codes
+        columns[f"{attribute}_inverse"] = inverse
+    return columns
+
+
+def _string_contains(column, value):
+    return np.char.find(column, value) >= 0
+
+
+# Vectorized comparisons per (column kind, operator); missing numeric values
+# are NaN, which never compares True
+_NUMERIC_PREDICATES = {">": filter_kernels.filter_gt, "<": filter_kernels.filter_lt, "==": filter_kernels.filter_eq}
+_STRING_PREDICATES = {"==": np.equal, "contains": _string_contains}
+
+
+def compile_filter(filter_dict):
     """
-    Apply a filter to a list of buildings.
+    Specialize a filter into a single predicate over the building columns.
+    The value is coerced and the comparison chosen once, up front.
     
     Args:
-        buildings (list): List of building dictionaries
+        filter_dict (dict): Filter to compile (from parse_query)
+    
+    Returns:
+        callable: predicate(columns) -> boolean mask over the buildings,
+        or None if the filter can't apply to its attribute
+    """
+    attribute = filter_dict["attribute"]
+    operator = filter_dict["operator"]
+    value = filter_dict["value"]
+    
+    if attribute in NUMERIC_COLUMNS:
+        compare = _NUMERIC_PREDICATES.get(operator)
+        try:
+            value = float(value)
+        except (ValueError, TypeError):
+            log.warning(f"Could not compare {attribute} with non-numeric value: {value}")
+            return None
+        column_name = attribute
+    elif attribute in STRING_COLUMNS:
+        compare = _STRING_PREDICATES.get(operator)
+        # For string comparison, compare lowercase on both sides
+        value = str(value).lower()
+        column_name = f"{attribute}_lower"
+    else:
+        log.warning(f"No column for attribute: {attribute}")
+        return None
+    
+    if compare is None:
+        log.warning(f"Operator {operator} not supported for {attribute}")
+        return None
+    
+    if attribute in INDEXED_COLUMNS:
+        # Compare against each distinct code once, then broadcast the result
+        # back to the buildings
+        codes_name, inverse_name = f"{attribute}_codes", f"{attribute}_inverse"
+        return lambda columns: compare(columns[codes_name], value)[columns[inverse_name]]
+    
+    return lambda columns: compare(columns[column_name], value)
+
+
+def apply_filter(columns, filter_dict):
+    """
+    Apply a filter to the buildings.
+    
+    Args:
+        columns (dict): Building columns from build_filter_columns
         filter_dict (dict): Filter to apply (from parse_query)
     
     Returns:
@@ -202,50 +775,24 @@ def apply_filter(buildings, filter_dict):
     if not filter_dict:
         return []
     
-    matching_ids = []
-    attribute = filter_dict["attribute"]
-    operator = filter_dict["operator"]
-    value = filter_dict["value"]
+    log.debug(f"Applying filter: {filter_dict['attribute']} {filter_dict['operator']} {filter_dict['value']}")
     
-    print(f"Applying filter: {attribute} {operator} {value}")
+    predicate = compile_filter(filter_dict)
+    if predicate is None:
+        return []
     
-    for building in buildings:
-        try:
-            building_value = building.get(attribute)
-            
-            if building_value is None:
-                continue
-            
-            matches = False
-            
-            if operator == ">":
-                matches = float(building_value) > float(value)
-            elif operator == "<":
-                matches = float(building_value) < float(value)
-            elif operator == "==":
-                matches = str(building_value).lower() == str(value).lower()
-            elif operator == "contains":
-                # For string containment, convert both to lowercase
-                if isinstance(building_value, str):
-                    matches = str(value).lower() in building_value.lower()
-            
-            if matches:
-                matching_ids.append(building["id"])
-        except Exception as e:
-            print(f"Error processing building {building.get('id')}: {e}")
-            continue
-    
-    print(f"Filter matched {len(matching_ids)} buildings")
+    matching_ids = columns["id"][predicate(columns)].tolist()
+    log.debug(f"Filter matched {len(matching_ids)} buildings")
     return matching_ids
 
 
-def process_query(user_query, buildings, api_key=None):
+def process_query(user_query, columns, api_key=None):
     """
     Process a user query end-to-end: parse with LLM, apply filter, return results.
     
     Args:
         user_query (str): Natural language query from the user
-        buildings (list): List of building dictionaries to filter
+        columns (dict): Building columns from build_filter_columns
         api_key (str): Optional Hugging Face API key override
     
     Returns:
@@ -262,7 +809,7 @@ def process_query(user_query, buildings, api_key=None):
         }
     
     # Apply filter to buildings
-    matching_ids = apply_filter(buildings, filter_dict)
+    matching_ids = apply_filter(columns, filter_dict)
     
     return {
         "matching_ids": matching_ids,
@@ -0,0 +1,345 @@
+"""
+Query cache module.
+Caches parsed filters for user queries so repeated and near-duplicate
+queries skip the LLM round trip:
+1. Exact cache keyed by the normalized query string
+2. Semantic cache matching sentence embeddings by cosine similarity
+Both tiers are saved to disk at exit and reloaded at startup.
+"""
+
+import atexit
+import contextlib
+import functools
+import logging
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import orjson
+
+try:
+    # Optional: without it only the exact cache is used
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    SentenceTransformer = None
+
+try:
+    # Unix only: serializes saves from several worker processes
+    import fcntl
+except ImportError:
+    fcntl = None
+
+log = logging.getLogger(__name__)
+
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+SIMILARITY_THRESHOLD = 0.92
+EXACT_CACHE_SIZE = 1024
+SEMANTIC_CACHE_SIZE = 4096
+
+# Persisted cache: embeddings as .npy (memory-mapped on load, so forked workers
+# share its pages) and a JSON-lines file whose first line is a header; bump
+# CACHE_FORMAT_VERSION whenever the layout or signature rules change
+CACHE_DIR = os.path.join(os.getenv("MASIV_CACHE_DIR", os.path.join(tempfile.gettempdir(), "masiv_cache")), "query_cache")
+CACHE_FORMAT_VERSION = 3
+EMBEDDINGS_FILE = "embeddings.npy"
+ENTRIES_FILE = "entries.jsonl"
+LOCK_FILE = ".lock"
+
+# Tokens that flip or change a filter's meaning while barely moving its
+# embedding: zoning codes ("cc-x", "r-cg"), numbers, comparison words, units,
+# including ones attached to a number ("2m" vs "2k"),
+# and street types and quadrants ("17 ave sw" vs "17 st sw")
+_SIGNATURE_PATTERN = re.compile(
+    r"\b[a-z]+-[a-z0-9]*|\d+(?:\.\d+)?|(?<=\d)(?:k|m|ft)\b|\b(?:over|above|under|below|more|less|greater|fewer|taller|shorter|"
+    r"higher|lower|after|before|since|until|not|million|thousand|k|feet|ft|meters?|m|"
+    r"st|street|ave?|avenue|rd|road|dr|drive|blvd|boulevard|tr|trail|way|cres|crescent|pl|place|"
+    r"nw|ne|sw|se)\b"
+)
+
+_SIGNATURE_ALIASES = {
+    "feet": "ft", "meter": "m", "meters": "m", "k": "thousand",
+    "above": "over", "below": "under",
+    "street": "st", "ave": "av", "avenue": "av", "road": "rd", "drive": "dr",
+    "boulevard": "blvd", "trail": "tr", "crescent": "cres", "place": "pl",
+}
+
+_lock = threading.Lock()
+_exact = OrderedDict()
+_embeddings = None  # (N, dim) float32, unit-normalized rows
+_entries = []  # parallel list of (normalized query, signature, filter_dict)
+_model = None
+_model_loaded = False
+_dirty = False  # stored to since the last load or save
+
+
+def normalize_query(user_query):
+    """Lowercase and collapse whitespace so trivially different queries share a key."""
+    return " ".join(user_query.strip().lower().split())
+
+
+def _signature(normalized_query):
+    """Numbers and comparison words in a query; semantic hits must agree on these."""
+    return tuple(_SIGNATURE_ALIASES.get(w, w) for w in _SIGNATURE_PATTERN.findall(normalized_query))
+
+
+def _get_model():
+    """Load the sentence embedding model once, or None if unavailable."""
+    global _model, _model_loaded
+    if not _model_loaded:
+        _model_loaded = True
+        if SentenceTransformer is not None:
+            try:
+                _model = SentenceTransformer(EMBEDDING_MODEL)
+            except Exception as e:
+                log.warning(f"Could not load embedding model {EMBEDDING_MODEL}: {e}")
+    return _model
+
+
+def embed_query(user_query):
+    """
+    Embed a query with the sentence embedding model.
+
+    Args:
+        user_query (str): Natural language query
+
+    Returns:
+        np.ndarray: Unit-normalized float32 vector, or None if no model is available
+    """
+    return _embed_normalized(normalize_query(user_query))
+
+
+# A query missing every cache tier is embedded by lookup, few-shot selection,
+# and store in turn; memoize so the model runs once
+@functools.lru_cache(maxsize=256)
+def _embed_normalized(normalized_query):
+    model = _get_model()
+    if model is None:
+        return None
+    vector = np.asarray(model.encode(normalized_query), dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    if not norm:
+        return None
+    vector /= norm
+    vector.flags.writeable = False
+    return vector
+
+
+def lookup(user_query):
+    """
+    Find a cached filter for a query.
+
+    Args:
+        user_query (str): Natural language query from the user
+
+    Returns:
+        dict: Copy of the cached filter, or None on a miss
+    """
+    key = normalize_query(user_query)
+    with _lock:
+        if key in _exact:
+            _exact.move_to_end(key)
+            return dict(_exact[key])
+        if _embeddings is None or len(_entries) == 0:
+            return None
+
+    # Embed outside the lock, it's the slow part
+    query_vector = embed_query(key)
+    if query_vector is None:
+        return None
+
+    with _lock:
+        if _embeddings is None or _embeddings.shape[1] != query_vector.shape[0]:
+            return None
+        scores = _embeddings @ query_vector
+        best = int(np.argmax(scores))
+        _, signature, filter_dict = _entries[best]
+        if scores[best] < SIMILARITY_THRESHOLD or signature != _signature(key):
+            return None
+        return dict(filter_dict)
+
+
+def store(user_query, filter_dict):
+    """
+    Cache a successfully parsed filter for a query.
+
+    Args:
+        user_query (str): Natural language query from the user
+        filter_dict (dict): Validated, normalized filter
+    """
+    global _embeddings, _dirty
+    key = normalize_query(user_query)
+    filter_dict = dict(filter_dict)
+    query_vector = embed_query(key)
+
+    with _lock:
+        _dirty = True
+        _exact[key] = filter_dict
+        _exact.move_to_end(key)
+        while len(_exact) > EXACT_CACHE_SIZE:
+            _exact.popitem(last=False)
+
+        if query_vector is None:
+            return
+        if _embeddings is None or _embeddings.shape[1] != query_vector.shape[0]:
+            _embeddings = query_vector[None, :]
+            _entries.clear()
+        else:
+            _embeddings = np.vstack([_embeddings, query_vector])
+        _entries.append((key, _signature(key), filter_dict))
+
+        # Drop the oldest entries once full
+        overflow = len(_entries) - SEMANTIC_CACHE_SIZE
+        if overflow > 0:
+            _embeddings = _embeddings[overflow:]
+            del _entries[:overflow]
+
+
+@contextlib.contextmanager
+def _cache_dir_lock(cache_dir):
+    """Hold an exclusive lock on the cache directory across processes (no-op without fcntl)."""
+    with open(os.path.join(cache_dir, LOCK_FILE), "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+def _read_cache_files(cache_dir):
+    """
+    Read the cache files written by save().
+
+    Args:
+        cache_dir (str): Directory for the cache files
+
+    Returns:
+        tuple: (embeddings, semantic records, exact records), embeddings
+        memory-mapped or None; or None if the files are missing, unreadable,
+        from another format version or embedding model, or don't line up
+    """
+    try:
+        with open(os.path.join(cache_dir, ENTRIES_FILE), "rb") as f:
+            lines = f.read().splitlines()
+        header = orjson.loads(lines[0])
+        if header.get("version") != CACHE_FORMAT_VERSION or header.get("model") != EMBEDDING_MODEL:
+            return None
+        records = [orjson.loads(line) for line in lines[1:]]
+        semantic_count = header["semantic"]
+        embeddings = None
+        if semantic_count:
+            embeddings = np.load(os.path.join(cache_dir, EMBEDDINGS_FILE), mmap_mode="r")
+            if embeddings.ndim != 2 or embeddings.shape[0] != semantic_count:
+                return None
+    except (OSError, ValueError, IndexError, KeyError) as e:
+        if not isinstance(e, FileNotFoundError):
+            log.warning(f"Ignoring unreadable query cache in {cache_dir}: {e}")
+        return None
+    return embeddings, records[:semantic_count], records[semantic_count:]
+
+
+def save(cache_dir=CACHE_DIR):
+    """
+    Merge both cache tiers into the files on disk if anything was stored
+    since the last load. Registered with atexit. Every gunicorn worker saves
+    its own copy, so saves are serialized with a file lock and merged with
+    what earlier workers wrote (this process's entries newest, oldest
+    trimmed) before each file is written to a temporary path and renamed
+    into place.
+
+    Args:
+        cache_dir (str): Directory for the cache files
+    """
+    global _dirty
+    with _lock:
+        if not _dirty:
+            return
+        embeddings = _embeddings
+        semantic = list(_entries)
+        exact = list(_exact.items())
+        _dirty = False
+
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with _cache_dir_lock(cache_dir):
+            merged_exact = OrderedDict()
+            merged_semantic = OrderedDict()  # query -> (signature, filter, vector)
+            on_disk = _read_cache_files(cache_dir)
+            if on_disk is not None:
+                disk_embeddings, disk_semantic, disk_exact = on_disk
+                for record in disk_exact:
+                    merged_exact[record["query"]] = record["filter"]
+                if disk_embeddings is not None and (embeddings is None or disk_embeddings.shape[1] == embeddings.shape[1]):
+                    for record, vector in zip(disk_semantic, np.asarray(disk_embeddings)):
+                        merged_semantic[record["query"]] = (record["signature"], record["filter"], vector)
+
+            for query, filter_dict in exact:
+                merged_exact.pop(query, None)
+                merged_exact[query] = filter_dict
+            if embeddings is not None:
+                for (query, signature, filter_dict), vector in zip(semantic, embeddings):
+                    merged_semantic.pop(query, None)
+                    merged_semantic[query] = (signature, filter_dict, vector)
+            while len(merged_exact) > EXACT_CACHE_SIZE:
+                merged_exact.popitem(last=False)
+            while len(merged_semantic) > SEMANTIC_CACHE_SIZE:
+                merged_semantic.popitem(last=False)
+
+            header = {
+                "version": CACHE_FORMAT_VERSION,
+                "model": EMBEDDING_MODEL,
+                "semantic": len(merged_semantic),
+            }
+            lines = [orjson.dumps(header)]
+            lines.extend(
+                orjson.dumps({"query": query, "signature": signature, "filter": filter_dict})
+                for query, (signature, filter_dict, _) in merged_semantic.items()
+            )
+            lines.extend(orjson.dumps({"query": query, "filter": filter_dict}) for query, filter_dict in merged_exact.items())
+
+            suffix = f".{os.getpid()}.tmp"
+            if merged_semantic:
+                path = os.path.join(cache_dir, EMBEDDINGS_FILE)
+                with open(path + suffix, "wb") as f:
+                    np.save(f, np.stack([vector for _, _, vector in merged_semantic.values()]).astype(np.float32))
+                os.replace(path + suffix, path)
+            path = os.path.join(cache_dir, ENTRIES_FILE)
+            with open(path + suffix, "wb") as f:
+                f.write(b"\n".join(lines))
+            os.replace(path + suffix, path)
+    except OSError as e:
+        log.warning(f"Could not save query cache to {cache_dir}: {e}")
+
+
+def load(cache_dir=CACHE_DIR):
+    """
+    Restore both cache tiers saved by save(). Files from another format
+    version or embedding model, or that don't line up, are ignored.
+
+    Args:
+        cache_dir (str): Directory for the cache files
+
+    Returns:
+        int: Number of cached queries restored
+    """
+    global _embeddings
+    if not os.path.isdir(cache_dir):
+        return 0
+    # Same lock as save(), so a worker exiting mid-merge can't hand us an
+    # entries file that doesn't line up with embeddings.npy
+    with _cache_dir_lock(cache_dir):
+        on_disk = _read_cache_files(cache_dir)
+    if on_disk is None:
+        return 0
+    embeddings, semantic, exact = on_disk
+
+    with _lock:
+        _embeddings = embeddings
+        _entries[:] = [(r["query"], tuple(r["signature"]), r["filter"]) for r in semantic]
+        _exact.clear()
+        for record in exact:
+            _exact[record["query"]] = record["filter"]
+    return len(_exact)
+
+
+atexit.register(save)
@@ -1,48 +1,157 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request
 from flask_cors import CORS
-from sodapy import Socrata
+from flask_compress import Compress
 from dotenv import load_dotenv
+import gzip
+import hashlib
+import logging
+import orjson
 import os
-import sys
-import traceback
-from openai import OpenAI
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+import filter_kernels
+import query_cache
 from data_fetcher import get_all_buildings
-from llm_processor import process_query
+from llm_processor import build_filter_columns, process_query
 
 load_dotenv()
 
-api_key = os.getenv("HF_TOKEN")
-client = OpenAI(
-    base_url="https://router.huggingface.co/v1",
-    api_key=api_key,
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "WARNING").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
 )
+log = logging.getLogger(__name__)
 
 # Cache for building data
 _buildings_cache = None
+# Columnar view of the cache used for query filtering
+_buildings_columns = None
+# Serialized /api/buildings response body, its gzipped copy, and its ETag
+_buildings_bytes = None
+_buildings_bytes_gz = None
+_buildings_etag = None
+
+BUILDINGS_MAX_AGE = 300
+
+# Set once the startup warm-up has finished, successfully or not
+_cache_ready = threading.Event()
+_cache_lock = threading.Lock()
+
+def _load_buildings_cache():
+    """Fetch buildings and precompute everything derived from them."""
+    global _buildings_cache, _buildings_columns, _buildings_bytes, _buildings_bytes_gz, _buildings_etag
+    data = get_all_buildings()
+    _buildings_columns = build_filter_columns(data)
+    # The data only changes on restart, so serialize the response once
+    _buildings_bytes = orjson.dumps({
+        "data": data,
+        "error": None,
+        "message": f"Returned {len(data)} buildings"
+    }, option=orjson.OPT_SERIALIZE_NUMPY)
+    _buildings_bytes_gz = gzip.compress(_buildings_bytes, compresslevel=6)
+    _buildings_etag = hashlib.blake2b(_buildings_bytes, digest_size=16).hexdigest()
+    _buildings_cache = data
+
+def _warm_buildings_cache():
+    """Load the cache in the background so the first request finds it ready."""
+    try:
+        filter_kernels.warmup()
+        with _cache_lock:
+            _load_buildings_cache()
+        log.info(f"SERVER READY: {len(_buildings_cache)} buildings loaded and cached")
+    except Exception:
+        log.exception("Failed to warm building data cache")
+    finally:
+        _cache_ready.set()
 
 def get_buildings_cache():
     """Get or fetch buildings data (cached)."""
-    global _buildings_cache
+    _cache_ready.wait()
     if _buildings_cache is None:
-        print("CACHE MISS: Loading building data from API...", flush=True)
-        sys.stdout.flush()
-        _buildings_cache = get_all_buildings()
-        print(f"CACHE LOADED: {len(_buildings_cache)} buildings cached", flush=True)
-        sys.stdout.flush()
+        # Warm-up failed; retry on demand
+        with _cache_lock:
+            if _buildings_cache is None:
+                log.info("CACHE MISS: Loading building data from API...")
+                _load_buildings_cache()
+                log.info(f"CACHE LOADED: {len(_buildings_cache)} buildings cached")
     return _buildings_cache
 
+def get_buildings_columns():
+    """Get the filter columns for the cached buildings data."""
+    get_buildings_cache()
+    return _buildings_columns
+
+# Shared memory segments backing _buildings_columns once shared
+_shared_segments = []
+
+def share_buildings_columns():
+    """
+    Move the filter columns into shared memory.
+    Called in the gunicorn master before it forks workers (see gunicorn.conf.py):
+    the segments are mapped MAP_SHARED, so every worker inherits the same
+    physical pages instead of a copy-on-write duplicate of each column.
+    
+    Returns:
+        int: Total bytes moved into shared memory
+    """
+    global _buildings_columns
+    columns = get_buildings_columns()
+    if _shared_segments:
+        return 0
+    
+    shared = {}
+    total = 0
+    for name, arr in columns.items():
+        # All columns are fixed-width (float, int, or "U" strings); empty ones
+        # can't back a segment and aren't worth sharing
+        if arr.nbytes == 0 or arr.dtype.hasobject:
+            shared[name] = arr
+            continue
+        shm = shared_memory.SharedMemory(create=True, size=arr.nbytes)
+        view = np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)
+        view[:] = arr
+        view.flags.writeable = False
+        shared[name] = view
+        _shared_segments.append(shm)
+        total += arr.nbytes
+    _buildings_columns = shared
+    log.info(f"Shared {total} bytes of filter columns across {len(_shared_segments)} segments")
+    return total
+
+def release_shared_columns():
+    """Unlink the shared column segments; call once from the process that created them."""
+    global _buildings_columns
+    if not _shared_segments:
+        return
+    # Detach the columns from the segments before closing them
+    _buildings_columns = {name: np.array(arr) for name, arr in _buildings_columns.items()}
+    for shm in _shared_segments:
+        shm.close()
+        shm.unlink()
+    _shared_segments.clear()
+
 app = Flask(__name__)
 CORS(app)
 
+app.config["COMPRESS_ALGORITHM"] = ["br", "gzip"]
+app.config["COMPRESS_MIN_SIZE"] = 1024
+Compress(app)
+
+def ojsonify(obj, status=200):
+    """Serialize obj to a JSON response with orjson (handles dataclasses and NumPy)."""
+    return app.response_class(
+        orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY),
+        status=status,
+        mimetype="application/json",
+    )
+
 # Initialize cache on startup
-print("=" * 60, flush=True)
-print("SERVER STARTUP: Initializing building data cache...", flush=True)
-print("=" * 60, flush=True)
-sys.stdout.flush()
-_buildings_cache = get_all_buildings()
-print(f"SERVER READY: {len(_buildings_cache)} buildings loaded and cached", flush=True)
-print("=" * 60, flush=True)
-sys.stdout.flush()
+restored = query_cache.load()
+log.info(f"Restored {restored} cached queries")
+log.info("SERVER STARTUP: Initializing building data cache...")
+threading.Thread(target=_warm_buildings_cache, name="buildings-warmup", daemon=True).start()
 
 @app.route('/')
 def home():
@@ -55,18 +164,29 @@ def buildings():
     Returns all buildings in the dataset with their attributes.
     """
     try:
-        buildings_data = get_buildings_cache()
-        return jsonify({
-            "data": buildings_data,
-            "error": None,
-            "message": f"Returned {len(buildings_data)} buildings"
-        })
+        get_buildings_cache()
+        # Serve the gzipped copy as-is; Flask-Compress skips encoded responses.
+        # ETag suffix matches what Flask-Compress uses for encoded variants.
+        if request.accept_encodings["gzip"]:
+            body, etag = _buildings_bytes_gz, f"{_buildings_etag}:gzip"
+        else:
+            body, etag = _buildings_bytes, _buildings_etag
+        headers = {
+            "ETag": f'"{etag}"',
+            "Cache-Control": f"public, max-age={BUILDINGS_MAX_AGE}",
+            "Vary": "Accept-Encoding",
+        }
+        if request.if_none_match.contains(etag):
+            return Response(status=304, headers=headers)
+        if body is _buildings_bytes_gz:
+            headers["Content-Encoding"] = "gzip"
+        return Response(body, mimetype="application/json", headers=headers)
     except Exception as e:
-        return jsonify({
+        return ojsonify({
             "data": [],
             "error": str(e),
             "message": "Failed to fetch buildings"
-        }), 500
+        }, status=500)
 
 @app.route('/api/query', methods=['POST'])
 def query_buildings():
@@ -94,36 +214,35 @@ def query_buildings():
         user_api_key = data.get("api_key", "").strip()
         
         if not user_query:
-            return jsonify({
+            return ojsonify({
                 "matching_ids": [],
                 "filter_parsed": None,
                 "error": "Query cannot be empty",
                 "message": "Please provide a query"
-            }), 400
+            }, status=400)
         
         # Get buildings data
-        buildings_data = get_buildings_cache()
+        buildings_columns = get_buildings_columns()
         
         # Process query with LLM (pass optional API key)
-        result = process_query(user_query, buildings_data, user_api_key if user_api_key else None)
+        result = process_query(user_query, buildings_columns, user_api_key if user_api_key else None)
         
         message = f"Found {len(result['matching_ids'])} matching buildings"
         
-        return jsonify({
+        return ojsonify({
             "matching_ids": result["matching_ids"],
             "filter_parsed": result["filter_parsed"],
             "error": result["error"],
             "message": message
         })
     except Exception as e:
-        print(f"ERROR in /api/query: {e}")
-        traceback.print_exc()
-        return jsonify({
+        log.exception(f"Error in /api/query: {e}")
+        return ojsonify({
             "matching_ids": [],
             "filter_parsed": None,
             "error": str(e),
             "message": "Failed to process query"
-        }), 500
+        }, status=500)
 
 @app.route('/members')
 def members():
@@ -0,0 +1,32 @@
+import pytest
+
+from llm_processor import _fast_parse
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("buildings over 100 feet", {"attribute": "height", "operator": ">", "value": 30.48}),
+    ("buildings taller than 20m", {"attribute": "height", "operator": ">", "value": 20.0}),
+    ("buildings under 15 meters", {"attribute": "height", "operator": "<", "value": 15.0}),
+    ("buildings built after 2010", {"attribute": "year_of_construction", "operator": ">", "value": 2010.0}),
+    ("buildings built since 2010", {"attribute": "year_of_construction", "operator": ">", "value": 2009.0}),
+    ("buildings built before 1950", {"attribute": "year_of_construction", "operator": "<", "value": 1950.0}),
+    ("buildings worth over $1 million", {"attribute": "assessed_value", "operator": ">", "value": 1000000.0}),
+    ("worth over 3m", {"attribute": "assessed_value", "operator": ">", "value": 3000000.0}),
+    ("commercial buildings", {"attribute": "land_use_designation", "operator": "contains", "value": "C-C"}),
+])
+def test_fast_parse_templated_queries(query, expected):
+    assert _fast_parse(query) == expected
+
+
+@pytest.mark.parametrize("query", [
+    # Bare "m" without a height cue could be millions
+    "properties over 3m",
+    "properties under 2m",
+    # Location and compound queries need the LLM
+    "buildings on park ave",
+    "the warehouse district",
+    "commercial buildings over 100 ft",
+    "buildings not over 100 ft",
+])
+def test_fast_parse_leaves_ambiguous_queries_to_llm(query):
+    assert _fast_parse(query) is None